@@ -4,7 +4,6 @@ import schedula
 from trytond.model import ModelSQL, ModelView, fields
 from trytond.pool import Pool, PoolMeta
 from trytond.transaction import Transaction
-from trytond.tools import cursor_dict
 from trytond.pyson import PYSONEncoder
 from trytond.i18n import gettext
 from trytond.exceptions import UserError
@@ -236,7 +235,8 @@ class Data(ModelSQL, ModelView):
 
         cursor = Transaction().connection.cursor()
         cursor.execute(*sql_table.select(where=sql_table.id.in_(ids)))
-        fetchall = list(cursor_dict(cursor))
+        names = tuple(d[0] for d in cursor.description)
+        fetchall = [dict(zip(names, row)) for row in cursor.fetchall()]
 
         to_cast = {}
         for field in table.fields:
@@ -1,17 +1,26 @@
+import io
+import re
 import sql
+import threading
+import numpy
 import formulas
 import unidecode
-from collections import OrderedDict
+from collections import defaultdict, namedtuple
 from decimal import Decimal
+from time import monotonic
+from uuid import uuid4
 from datetime import datetime, date, time
+from functools import lru_cache, reduce
 from dateutil import relativedelta
+from trytond import backend
 from trytond.model import (Workflow, ModelSQL, ModelView, fields,
     sequence_ordered, Unique)
 from trytond.pyson import PYSONEncoder, PYSONDecoder, PYSON, Eval, Bool
 from trytond.pool import Pool
 from trytond.transaction import Transaction
-from trytond.tools import cursor_dict
 from trytond.config import config
+from trytond.tools import grouped_slice, reduce_ids
+from trytond.cache import Cache
 from trytond.i18n import gettext
 from trytond.exceptions import UserError
 from .tag import TaggedMixin
@@ -21,7 +30,9 @@ function
 
 __all__ = ['Sheet', 'DataSet', 'Formula', 'View', 'ViewTableFormula']
 
-RECORD_CACHE_SIZE = config.get('cache', 'record')
+RECORD_CACHE_SIZE = config.getint('cache', 'record')
+
+_PYSON_ENCODER = PYSONEncoder()
 
 FIELD_TYPES = [
     # (Internal selection name, Tryton field name, String, fields.Class, DB
@@ -51,12 +62,26 @@ FIELD_TYPES = [
         None),
     ]
 
+FieldSpec = namedtuple('FieldSpec', 'tryton string klass sql python cast')
+
+FIELD_TYPES_BY_NAME = {x[0]: FieldSpec(*x[1:]) for x in FIELD_TYPES}
+
 FIELD_TYPE_SELECTION = [(x[0], x[2]) for x in FIELD_TYPES]
-FIELD_TYPE_SQL = dict([(x[0], x[4]) for x in FIELD_TYPES])
-FIELD_TYPE_CLASS = dict([(x[0], x[3]) for x in FIELD_TYPES])
-FIELD_TYPE_PYTHON = dict([(x[0], x[5]) for x in FIELD_TYPES])
-FIELD_TYPE_TRYTON = dict([(x[0], x[1]) for x in FIELD_TYPES])
-FIELD_TYPE_CAST = dict([(x[0], x[6]) for x in FIELD_TYPES])
+FIELD_TYPE_SQL = {k: v.sql for k, v in FIELD_TYPES_BY_NAME.items()}
+FIELD_TYPE_CLASS = {k: v.klass for k, v in FIELD_TYPES_BY_NAME.items()}
+FIELD_TYPE_PYTHON = {k: v.python for k, v in FIELD_TYPES_BY_NAME.items()}
+FIELD_TYPE_TRYTON = {k: v.tryton for k, v in FIELD_TYPES_BY_NAME.items()}
+FIELD_TYPE_CAST = {k: v.cast for k, v in FIELD_TYPES_BY_NAME.items()}
+
+# Field type of the values returned by SQL data sets
+PYTHON_FIELD_TYPE = {
+    int: 'integer',
+    str: 'char',
+    float: 'float',
+    bool: 'boolean',
+    Decimal: 'numeric',
+    datetime: 'datetime',
+    }
 
 VALID_FIRST_SYMBOLS = 'abcdefghijklmnopqrstuvwxyz'
 VALID_NEXT_SYMBOLS = '_0123456789'
@@ -68,42 +93,233 @@ SELECTION_EDITABLE = [
     ('disabled', 'Disabled'),
     ]
 
+INVALID_SYMBOLS = re.compile('[^%s]+' % VALID_SYMBOLS)
+
+
+@lru_cache(maxsize=4096)
 def convert_to_symbol(text):
     if not text:
         return 'x'
     text = unidecode.unidecode(text)
-    text = text.lower()
-    first = text[0]
-    symbol = first
-    if first not in VALID_FIRST_SYMBOLS:
-        symbol = '_'
-        if symbol in VALID_SYMBOLS:
-            symbol += first
-
-    for x in text[1:]:
-        if not x in VALID_SYMBOLS and symbol[-1] != '_':
-            symbol += '_'
-        else:
-            symbol += x
+    symbol = INVALID_SYMBOLS.sub('_', text.lower())
+    if symbol[0] not in VALID_FIRST_SYMBOLS:
+        symbol = '_' + symbol
     return symbol
 
 
-class Record(dict):
-    def __init__(self, dictionary):
-        self.dictionary = dictionary
+def comparison(function):
+    return lambda x, y: function(x, y).astype(float)
+
+
+# Operators and functions that numpy computes exactly as the formulas library
+NUMERIC_OPERATORS = {
+    '+': (numpy.add, None, 'number'),
+    '-': (numpy.subtract, None, 'number'),
+    '*': (numpy.multiply, None, 'number'),
+    '/': (numpy.true_divide, None, 'number'),
+    'u+': (numpy.positive, None, 'number'),
+    'u-': (numpy.negative, None, 'number'),
+    '%': (lambda x: x / 100, None, 'number'),
+    # formulas ranks booleans above numbers when comparing
+    '>': (comparison(numpy.greater), 'number', 'bool'),
+    '>=': (comparison(numpy.greater_equal), 'number', 'bool'),
+    '<': (comparison(numpy.less), 'number', 'bool'),
+    '<=': (comparison(numpy.less_equal), 'number', 'bool'),
+    '=': (comparison(numpy.equal), 'number', 'bool'),
+    '<>': (comparison(numpy.not_equal), 'number', 'bool'),
+    'ABS': (numpy.absolute, 'number', 'number'),
+    'MIN': (lambda *x: reduce(numpy.minimum, x), 'number', 'number'),
+    'MAX': (lambda *x: reduce(numpy.maximum, x), 'number', 'number'),
+    }
+
+NUMERIC_TYPES = (int, float)
+
+NODE_SUFFIX = re.compile(r'<\d+>$')
+
+KERNEL_TYPES = (int, float, Decimal, bool)
+
+# Functions whose result does not only depend on their arguments
+VOLATILE_FUNCTIONS = frozenset(('NOW', 'TODAY', 'RAND', 'RANDBETWEEN'))
+
+FORMULA_CACHE_SIZE = 4096
+# Types whose equal values can not give different results, unlike 0.0 and
+# -0.0 or Decimal('1.0') and Decimal('1')
+MEMOIZED_TYPES = (type(None), bool, int, str, date, bytes)
+
+
+CompiledExpression = namedtuple('CompiledExpression',
+    'inputs elementwise kernel volatile missing')
+
+
+@lru_cache(maxsize=1024)
+def compile_expression(expression):
+    parser = formulas.Parser()
+    tokens, builder = parser.ast(expression)
+    # Find missing methods:
+    # https://github.com/vinci1it2000/formulas/issues/19#issuecomment-429793111
+    missing = frozenset(NODE_SUFFIX.sub('', k)
+        for k, v in builder.dsp.function_nodes.items()
+        if v['function'] is formulas.functions.not_implemented)
+    if missing:
+        return CompiledExpression((), False, None, False, missing)
+    # Elementwise expressions only use operators
+    ast = builder.compile()
+    functions = {x.name.upper() for x in tokens
+        if isinstance(x, formulas.tokens.function.Function)}
+    return CompiledExpression(tuple(x.lower() for x in ast.inputs.keys()),
+        not functions, numeric_kernel(builder, ast),
+        bool(functions & VOLATILE_FUNCTIONS), missing)
+
+
+_local = threading.local()
+
+
+def _compile_ast(expression):
+    return formulas.Parser().ast(expression)[1].compile()
+
+
+# Calling an AST stores the solution on it so each thread has its own
+def expression_ast(expression):
+    compile_ast = getattr(_local, 'compile_ast', None)
+    if compile_ast is None:
+        compile_ast = _local.compile_ast = lru_cache(maxsize=256)(
+            _compile_ast)
+    return compile_ast(expression)
+
+
+def numeric_kernel(builder, ast):
+    kinds = {x: 'number' for x in ast.inputs}
+    constants = {}
+    for node_id, default in builder.dsp.default_values.items():
+        value = default['value']
+        if type(value) not in NUMERIC_TYPES:
+            return
+        constants[node_id] = float(value)
+        kinds[node_id] = 'number'
+    steps = []
+    for node_id, node in builder.dsp.function_nodes.items():
+        inputs = node['inputs']
+        # Repeated operators and functions are suffixed like '+<0>'
+        name = NODE_SUFFIX.sub('', node_id)
+        if name == 'IF':
+            # IF(condition, value) returns FALSE instead of a number
+            if (len(inputs) != 3 or kinds.get(inputs[1]) != 'number'
+                    or kinds.get(inputs[2]) != 'number'):
+                return
+            function, kind = numpy.where, 'number'
+        else:
+            function, required, kind = NUMERIC_OPERATORS.get(name,
+                (None, None, None))
+            if function is None:
+                return
+            if required and any(kinds.get(x) != required for x in inputs):
+                return
+        output = node['outputs'][0]
+        kinds[output] = kind
+        steps.append((function, inputs, output))
+    if not steps:
+        return
+    names = list(ast.inputs.keys())
+    # Comparisons give numbers so they are turned back into booleans
+    boolean = kinds[steps[-1][2]] == 'bool'
+
+    def kernel(*args):
+        values = constants.copy()
+        values.update(zip(names, args))
+        for function, inputs, output in steps:
+            result = function(*[values[x] for x in inputs])
+            if not numpy.isfinite(result).all():
+                return
+            values[output] = result
+        if boolean:
+            return result.astype(bool)
+        return result
+    return kernel
+
+
+def evaluate_numeric(kernel, columns):
+    if not all(type(v) in NUMERIC_TYPES for x in columns for v in x):
+        return
+    with numpy.errstate(all='ignore'):
+        result = kernel(*[numpy.array(x, dtype=float) for x in columns])
+    if result is not None:
+        return numpy.broadcast_to(result, (len(columns[0]),)).tolist()
+
+
+def row_evaluator(ast, ftype, volatile):
+    def evaluate(*inputs):
+        # Some functions like IF() may return plain Python values
+        return ftype(numpy.asarray(ast(*inputs)).tolist())
+    if volatile:
+        return evaluate
+    cached = lru_cache(maxsize=FORMULA_CACHE_SIZE, typed=True)(evaluate)
+
+    def memoized(*inputs):
+        if all(type(x) in MEMOIZED_TYPES for x in inputs):
+            return cached(*inputs)
+        return evaluate(*inputs)
+    return memoized
+
+
+COPY_ESCAPES = str.maketrans({
+        '\\': '\\\\',
+        '\t': '\\t',
+        '\n': '\\n',
+        '\r': '\\r',
+        })
+
+COPY_FORMATS = {
+    type(None): lambda x: '\\N',
+    str: lambda x: x.translate(COPY_ESCAPES),
+    bool: lambda x: 'true' if x else 'false',
+    int: str,
+    float: repr,
+    Decimal: str,
+    date: str,
+    datetime: str,
+    time: str,
+    bytes: lambda x: '\\\\x' + x.hex(),
+    memoryview: lambda x: '\\\\x' + x.hex(),
+    }
+
+
+# Other values are left to the casts of INSERT
+COPY_TYPES = {
+    'VARCHAR': (str,),
+    'INTEGER': (int,),
+    'FLOAT': (int, float, Decimal),
+    'NUMERIC': (int, float, Decimal),
+    'BOOLEAN': (bool,),
+    'DATE': (date,),
+    'DATETIME': (datetime,),
+    'TIMESTAMP': (datetime,),
+    'TIME': (time,),
+    'BLOB': (bytes, memoryview),
+    }
+
+
+def copy_formats(sql_type):
+    return {x: COPY_FORMATS[x]
+        for x in (type(None),) + COPY_TYPES.get(sql_type, ())}
 
-    def __getattr__(self, name):
-        return self.dictionary[name]
 
+def copy_line(values, formats):
+    return '\t'.join([f[type(x)](x) for f, x in zip(formats, values)]) + '\n'
 
-def cursor_object(cursor, size=None):
+
+def cursor_rows(cursor, size=None):
     size = cursor.arraysize if size is None else size
-    while True:
-        rows = cursor.fetchmany(size)
-        if not rows:
-            break
-        for row in rows:
-            yield Record({d[0]: v for d, v in zip(cursor.description, row)})
+    names = None
+    try:
+        while True:
+            rows = cursor.fetchmany(size)
+            if not rows:
+                break
+            if names is None:
+                names = tuple(d[0] for d in cursor.description)
+            yield names, rows
+    finally:
+        cursor.close()
 
 
 class TimeoutException(Exception):
@@ -111,14 +327,15 @@ class TimeoutException(Exception):
 
 
 class TimeoutChecker:
+    __slots__ = ('_timeout', '_callback', '_deadline')
+
     def __init__(self, timeout, callback):
         self._timeout = timeout
         self._callback = callback
-        self._start = datetime.now()
+        self._deadline = monotonic() + timeout
 
     def check(self):
-        elapsed = (datetime.now() - self._start).seconds
-        if elapsed > self._timeout:
+        if monotonic() > self._deadline:
             self._callback()
 
 SHEET_STATES = [
@@ -165,6 +382,7 @@ class Sheet(TaggedMixin, Workflow, ModelSQL, ModelView):
             },
         help='"Bottom" adds new records at the bottom of the list.\n'
         '"Top" adds new records at the top of the list.')
+    _python_code_cache = Cache('shine.sheet.python_code', context=False)
 
     @staticmethod
     def default_quick_edition():
@@ -243,7 +461,7 @@ class Sheet(TaggedMixin, Workflow, ModelSQL, ModelView):
 
     @fields.depends('tags')
     def on_change_with_tags_char(self, name=None):
-        return ', '.join(sorted([x.name for x in self.tags]))
+        return ', '.join(sorted(x.name for x in self.tags))
 
     @classmethod
     def search_tags_char(cls, name, clause):
@@ -287,7 +505,7 @@ class Sheet(TaggedMixin, Workflow, ModelSQL, ModelView):
 
             if (not sheet.dataset
                     and sheet.current_table
-                    and sheet.current_table.count()):
+                    and not sheet.current_table.is_empty()):
                 table.copy_from(sheet.current_table)
                 with Transaction().set_context({'shine_table': table.id}):
                     Data.update_formulas()
@@ -295,6 +513,7 @@ class Sheet(TaggedMixin, Workflow, ModelSQL, ModelView):
             sheet.current_table = table
 
         cls.save(sheets)
+        cls._python_code_cache.clear()
         cls.reset_views(sheets)
 
     @classmethod
@@ -303,9 +522,15 @@ class Sheet(TaggedMixin, Workflow, ModelSQL, ModelView):
         View = pool.get('shine.view')
 
         to_delete = []
+        to_update = []
         for sheet in sheets:
-            to_delete += [x for x in sheet.views if x .system]
+            for view in sheet.views:
+                if view.system:
+                    to_delete.append(view)
+                else:
+                    to_update.append(view)
         View.delete(to_delete)
+        View.update_actions(to_update)
 
         sheets = cls.browse([x.id for x in sheets])
 
@@ -431,10 +656,11 @@ class Sheet(TaggedMixin, Workflow, ModelSQL, ModelView):
         Formula = pool.get('shine.formula')
         Model = pool.get('ir.model')
         formulas = []
+        to_relate = {}
         for sheet in sheets:
             if not sheet.dataset:
                 return
-            current_formulas = [x.alias for x in sheet.formulas]
+            current_formulas = {x.alias for x in sheet.formulas}
             for field in sheet.dataset.get_fields():
                 if field['alias'] in current_formulas:
                     continue
@@ -444,12 +670,16 @@ class Sheet(TaggedMixin, Workflow, ModelSQL, ModelView):
                 formula.alias = field['alias']
                 formula.type = field['type']
                 if field.get('related_model'):
-                    related_model, = Model.search([
-                            ('model', '=', field['related_model']),
-                            ])
-                    formula.related_model = related_model
+                    to_relate.setdefault(field['related_model'], []).append(
+                        formula)
                 formula.store = True
                 formulas.append(formula)
+        if to_relate:
+            for model in Model.search([
+                        ('model', 'in', list(to_relate.keys())),
+                        ]):
+                for formula in to_relate[model.model]:
+                    formula.related_model = model
         if formulas:
             Formula.save(formulas)
 
@@ -462,73 +692,143 @@ class Sheet(TaggedMixin, Workflow, ModelSQL, ModelView):
         cursor = Transaction().connection.cursor()
 
         table = sql.Table(self.data_table_name)
-        cursor.execute(*table.delete())
-
-        #fields = dict([(x.alias, x) for x in self.formulas])
-        direct_fields = [x.alias for x in self.formulas if not
-            x.expression]
-        formula_fields = [x.alias for x in self.formulas if x.expression]
-        sql_fields = [sql.Column(table, x) for x in direct_fields +
-            formula_fields]
+        # TRUNCATE blocks the readers of the table until commit
+        if backend.name == 'postgresql':
+            cursor.execute('TRUNCATE TABLE "%s"' % self.data_table_name)
+        else:
+            cursor.execute(*table.delete())
 
-        parser = formulas.Parser()
-        formula_fields = [(x, parser.ast(x.expression)[1].compile() if
-                x.expression.startswith('=') else '') for x in self.formulas if
-            x.expression]
+        direct_fields = []
+        formula_fields = []
+        for formula in self.formulas:
+            if not formula.expression:
+                direct_fields.append(formula.alias)
+                continue
+            spec = FIELD_TYPES_BY_NAME[formula.type]
+            if formula.expression.startswith('='):
+                inputs, elementwise, kernel, volatile, _ = (
+                    compile_expression(formula.expression))
+                ast = expression_ast(formula.expression)
+                evaluate = row_evaluator(ast, spec.python, volatile)
+                if not inputs or spec.python not in KERNEL_TYPES:
+                    kernel = None
+                literal = None
+            else:
+                ast, inputs, elementwise, kernel, volatile, evaluate = (None,
+                    (), False, None, False, None)
+                literal = spec.python(formula.expression)
+            formula_fields.append((formula.alias, ast, inputs, elementwise,
+                    kernel, volatile, evaluate, spec.python, literal))
+        aliases = direct_fields + [x[0] for x in formula_fields]
+        sql_fields = [sql.Column(table, x) for x in aliases]
+
+        query = self.dataset.get_query()
+        if not formula_fields and query:
+            columns = ['"%s"' % x for x in direct_fields]
+            selected = columns
+            if backend.name == 'postgresql':
+                # Like the assignment casts of the values given to INSERT
+                sql_type = Transaction().database.sql_type
+                types = {x.alias: x.type for x in self.formulas}
+                selected = ['CAST(%s AS %s)' % (x,
+                        sql_type(FIELD_TYPE_SQL[types[y]])[1])
+                    for x, y in zip(columns, direct_fields)]
+            cursor.execute('INSERT INTO "%s" (%s) SELECT %s FROM (%s) AS source'
+                % (self.data_table_name, ', '.join(columns),
+                    ', '.join(selected), query))
+            return
 
-        insert_values = []
+        if backend.name == 'postgresql':
+            copy = 'COPY "%s" (%s) FROM STDIN' % (self.data_table_name,
+                ', '.join('"%s"' % x for x in aliases))
+            types = {x.alias: x.type for x in self.formulas}
+            formats = [copy_formats(FIELD_TYPE_SQL.get(types[x]))
+                for x in aliases]
+
+            def insert(rows):
+                try:
+                    data = ''.join([copy_line(x, formats) for x in rows])
+                except KeyError:
+                    cursor.execute(*table.insert(sql_fields, rows))
+                else:
+                    cursor.copy_expert(copy, io.StringIO(data))
+        else:
+            def insert(rows):
+                cursor.execute(*table.insert(sql_fields, rows))
+        to_insert = []
         checker = TimeoutChecker(self.timeout, self.timeout_exception)
         if not formula_fields:
             # If there are no formula_fields we can make the loop faster as
-            # we don't use OrderedDict and don't evaluate formulas
-            for records in self.dataset.get_data():
+            # we don't build a values dict and don't evaluate formulas
+            for names, rows in self.dataset.get_data(direct_fields):
                 checker.check()
-                for record in records:
-                    insert_values.append([getattr(record, x) for x in
-                            direct_fields])
+                to_insert.extend(rows)
+                if len(to_insert) >= RECORD_CACHE_SIZE:
+                    insert(to_insert)
+                    to_insert = []
         else:
-            for records in self.dataset.get_data():
+            for names, rows in self.dataset.get_data(direct_fields):
                 checker.check()
-                for record in records:
-                    values = OrderedDict()
-                    if direct_fields:
-                        values.update(OrderedDict([(x, getattr(record, x)) for
-                                    x in direct_fields]))
-                    if formula_fields:
-                        for field, ast in formula_fields:
-                            if field.expression.startswith('='):
-                                inputs = []
-                                for input_ in ast.inputs.keys():
-                                    # TODO: Check if input_ exists and raise
-                                    # proper user error Indeed, we should check
-                                    # de formulas when we move to active state
-                                    inputs.append(values[input_.lower()])
-                                value = ast(inputs)[0]
-                            else:
-                                value = field.expression
-                            ftype = FIELD_TYPE_PYTHON[field.type]
-                            values[field] = ftype(value)
-                    insert_values.append(list(values.values()))
-        if insert_values:
-            cursor.execute(*table.insert(sql_fields, insert_values))
+                # Rows are transposed so each formula is given whole columns
+                columns = dict(zip(names, zip(*rows)))
+                for (alias, ast, inputs, elementwise, kernel, volatile,
+                        evaluate, ftype, literal) in formula_fields:
+                    # TODO: Check if input exists and raise proper user error
+                    # Indeed, we should check de formulas when we move to
+                    # active state
+                    args = [columns[x] for x in inputs]
+                    result = None
+                    if kernel:
+                        result = evaluate_numeric(kernel, args)
+                    if result is not None:
+                        values = [ftype(x) for x in result]
+                    elif ast is None:
+                        values = [literal] * len(rows)
+                    elif not inputs and volatile:
+                        values = [evaluate() for _ in rows]
+                    elif not inputs:
+                        values = [evaluate()] * len(rows)
+                    elif elementwise:
+                        result = ast(*args)
+                        if not isinstance(result, (list, tuple)):
+                            result = numpy.broadcast_to(numpy.asarray(result),
+                                (len(rows),)).tolist()
+                        values = [ftype(x) for x in result]
+                    else:
+                        values = [evaluate(*x) for x in zip(*args)]
+                    columns[alias] = values
+                to_insert.extend(zip(*[columns[x] for x in aliases]))
+                if len(to_insert) >= RECORD_CACHE_SIZE:
+                    insert(to_insert)
+                    to_insert = []
+        if to_insert:
+            insert(to_insert)
 
     def get_python_code(self, name):
+        key = None
+        if self.state != 'draft':
+            key = (self.id, self.revision, self.name, self.alias)
+            code = self._python_code_cache.get(key)
+            if code is not None:
+                return code
+
         models = []
         if self.type == 'singleton':
             models.append('ModelSingleton')
         models += ['ModelSQL', 'ModelView']
 
-        class_name = ''.join([x.capitalize() for x in self.alias.split('_')])
-        code = []
-        code.append('class %s(%s):' % (class_name, ', '.join(models)))
-        code.append('    "%s"' % self.name)
-        code.append('    __name__ = "%s"' % self.alias.replace('_', '.'))
-        for formula in self.formulas:
-            if not formula.type:
-                continue
-            code.append('    %s = fields.%s("%s")' % (formula.alias,
-                FIELD_TYPE_CLASS[formula.type], formula.name))
-        return '\n'.join(code)
+        class_name = ''.join(x.capitalize() for x in self.alias.split('_'))
+        header = [
+            'class %s(%s):' % (class_name, ', '.join(models)),
+            '    "%s"' % self.name,
+            '    __name__ = "%s"' % self.alias.replace('_', '.'),
+            ]
+        code = '\n'.join(header + ['    %s = %s("%s")' % (x.alias,
+                    FIELD_TYPE_CLASS[x.type], x.name)
+                for x in self.formulas if x.type])
+        if key:
+            self._python_code_cache.set(key, code)
+        return code
 
     def timeout_exception(self):
         raise TimeoutException
@@ -667,35 +967,22 @@ class DataSet(ModelSQL, ModelView):
         return res
 
     def get_fields_sql(self):
-        def value_to_type(value):
-            TYPES = {
-                None: 'char',
-                int: 'integer',
-                str: 'char',
-                float: 'float',
-                bool: 'boolean',
-                Decimal: 'numeric',
-                datetime: 'datetime',
-                }
-            return TYPES.get(type(value), 'char')
-
-        res = []
         cursor = Transaction().connection.cursor()
-        cursor.execute(self.query)
-        fetchall = list(cursor_dict(cursor, size=1))
-        for record in fetchall:
-            res = [{
-                    'name': key,
-                    'alias': key,
-                    'type': value_to_type(value),
-                    } for key, value in record.items()]
-            break
-        return res
+        cursor.execute('SELECT * FROM (%s) AS source LIMIT 1'
+            % self.get_query())
+        row = cursor.fetchone()
+        if row is None:
+            return []
+        return [{
+                'name': column[0],
+                'alias': column[0],
+                'type': PYTHON_FIELD_TYPE.get(type(value), 'char'),
+                } for column, value in zip(cursor.description, row)]
 
     def get_fields(self):
         return getattr(self, 'get_fields_%s' % self.source)()
 
-    def get_data_model(self):
+    def get_data_model(self, names):
         pool = Pool()
         Model = pool.get(self.model.model)
         domain = []
@@ -705,33 +992,55 @@ class DataSet(ModelSQL, ModelView):
         if self.model_context:
             context = PYSONDecoder().decode(self.model_context)
         order = [('id', 'ASC')]
+        keyset = not self.model_order
         if self.model_order:
             order = PYSONDecoder().decode(self.model_order)
         limit = RECORD_CACHE_SIZE
         offset = 0
+        last_id = 0
+        fields_names = list(names)
         with Transaction().set_context(context):
             while True:
-                records = Model.search(domain, offset=offset, limit=limit,
-                    order=order)
+                if keyset:
+                    records = Model.search_read(
+                        [domain, ('id', '>', last_id)], limit=limit,
+                        order=order, fields_names=fields_names)
+                else:
+                    records = Model.search_read(domain, offset=offset,
+                        limit=limit, order=order,
+                        fields_names=fields_names)
                 if records:
-                    yield records
+                    yield names, [tuple(r[x] for x in names) for r in records]
                 if len(records) < limit:
                     break
+                offset += limit
+                last_id = records[-1]['id']
+
+    def get_data_sheet(self, names):
+        return self.get_data_cursor(self.get_query())
 
-    def get_data_sheet(self):
-        query = 'SELECT * FROM "%s"' % self.sheet.data_table_name
-        yield self.get_data_cursor(query)
+    def get_data_sql(self, names):
+        return self.get_data_cursor(self.get_query())
 
-    def get_data_sql(self):
-        yield self.get_data_cursor(self.query)
+    def get_query(self):
+        if self.source == 'sheet':
+            return 'SELECT * FROM "%s"' % self.sheet.data_table_name
+        if self.source == 'sql':
+            # Allow the query to be used as a subquery
+            return self.query.strip().rstrip(';')
 
     def get_data_cursor(self, query):
-        cursor = Transaction().connection.cursor()
+        connection = Transaction().connection
+        if backend.name == 'postgresql':
+            cursor = connection.cursor('shine_dataset_%s' % uuid4().hex)
+            cursor.itersize = RECORD_CACHE_SIZE
+        else:
+            cursor = connection.cursor()
         cursor.execute(query)
-        return cursor_object(cursor)
+        return cursor_rows(cursor, RECORD_CACHE_SIZE)
 
-    def get_data(self):
-        return getattr(self, 'get_data_%s' % self.source)()
+    def get_data(self, names):
+        return getattr(self, 'get_data_%s' % self.source)(names)
 
 
 class Formula(sequence_ordered(), ModelSQL, ModelView):
@@ -752,9 +1061,9 @@ class Formula(sequence_ordered(), ModelSQL, ModelView):
             'readonly': Eval('sheet_state') != 'draft',
             }, depends=['sheet_state'])
     expression_icon = fields.Function(fields.Char('Expression Icon'),
-        'on_change_with_expression_icon')
+        'get_formula_error_fields')
     current_value = fields.Function(fields.Char('Value'),
-        'on_change_with_current_value')
+        'get_formula_error_fields')
     type = fields.Selection([(None, '')] + FIELD_TYPE_SELECTION, 'Field Type',
         states={
             'readonly': Eval('sheet_state') != 'draft',
@@ -809,37 +1118,25 @@ class Formula(sequence_ordered(), ModelSQL, ModelView):
         if self.sheet:
             return self.sheet.state
 
-    def formula_error(self):
+    def formula_error(self, previous=None):
         if not self.expression:
             return
         if not self.expression.startswith('='):
             return
-        parser = formulas.Parser()
         try:
-            builder = parser.ast(self.expression)[1]
-            # Find missing methods:
-            # https://github.com/vinci1it2000/formulas/issues/19#issuecomment-429793111
-            missing_methods = [k for k, v in builder.dsp.function_nodes.items()
-                if v['function'] is formulas.functions.not_implemented]
-            if missing_methods:
-                # When there are two occurrences of the same missing method,
-                # the function name returned looks like this:
-                #
-                # Sample formula: A(x) + A(y)
-                # missing_methods: ['A', 'A<0>']
-                #
-                # So in the line below we remove the '<0>' suffix
-                missing_methods = {x.split('<')[0] for x in missing_methods}
-                if len(missing_methods) == 1:
+            compiled = compile_expression(self.expression)
+            if compiled.missing:
+                if len(compiled.missing) == 1:
                     msg = 'Unknown method: '
                 else:
                     msg = 'Unknown methods: '
-                msg += (', '.join(missing_methods))
+                msg += (', '.join(sorted(compiled.missing)))
                 return ('error', msg)
 
-            ast = builder.compile()
-            missing = (set([x.lower() for x in ast.inputs]) -
-                self.previous_formulas())
+            if previous is None:
+                previous = self.previous_formulas()
+            missing = list(dict.fromkeys(
+                    x for x in compiled.inputs if x not in previous))
             if not missing:
                 return
             return ('warning', 'Referenced alias "%s" not found. Ensure it is '
@@ -858,19 +1155,39 @@ class Formula(sequence_ordered(), ModelSQL, ModelView):
             res.append(formula.alias)
         return set(res)
 
-    @fields.depends('expression', 'sheet', '_parent_sheet.formulas')
-    def on_change_with_expression_icon(self, name=None):
+    @classmethod
+    def get_formula_error_fields(cls, formulas, names):
+        previous = {}
+        for sheet in {x.sheet for x in formulas}:
+            aliases = set()
+            for formula in sheet.formulas:
+                previous[formula.id] = frozenset(aliases)
+                aliases.add(formula.alias)
+
+        res = {x: {} for x in names}
+        for formula in formulas:
+            error = formula.formula_error(previous.get(formula.id))
+            if 'expression_icon' in names:
+                res['expression_icon'][formula.id] = formula.error_icon(error)
+            if 'current_value' in names:
+                res['current_value'][formula.id] = error and error[1]
+        return res
+
+    def error_icon(self, error):
         if not self.expression:
             return ''
         if not self.expression.startswith('='):
             return ''
-        error = self.formula_error()
         if not error:
             return 'green'
         if error[0] == 'warning':
             return 'orange'
         return 'red'
 
+    @fields.depends('expression', 'sheet', '_parent_sheet.formulas')
+    def on_change_with_expression_icon(self, name=None):
+        return self.error_icon(self.formula_error())
+
     @fields.depends('expression', 'sheet', '_parent_sheet.formulas')
     def on_change_with_current_value(self, name=None):
         res = self.formula_error()
@@ -887,6 +1204,62 @@ class Formula(sequence_ordered(), ModelSQL, ModelView):
             return
         self.alias = convert_to_symbol(self.name)
 
+NUMERIC_FIELD_TYPES = frozenset(('integer', 'float', 'numeric'))
+
+
+@lru_cache(maxsize=256)
+def table_arch(lines, editable):
+    # TODO: Duplicated from get_tree_view() but this one is not editable
+    parts = []
+    append = parts.append
+    current_icon = None
+    for alias, type_, name in lines:
+        if type_ in ('datetime', 'timestamp'):
+            append('<field name="%s" widget="date"/>\n'
+                '<field name="%s" widget="time"/>\n' % (alias, alias))
+            continue
+        if type_ == 'icon':
+            current_icon = alias
+            continue
+        attributes = ''
+        if type_ in NUMERIC_FIELD_TYPES:
+            attributes += ' sum="Total %s"' % name
+        if current_icon:
+            attributes += ' icon="%s"' % current_icon
+            current_icon = None
+        if type_ == 'image':
+            attributes += ' widget="image"'
+        append('<field name="%s"%s/>\n' % (alias, attributes))
+
+    attributes = ''
+    if editable and editable != 'disabled':
+        attributes = ' editable="%s"' % editable
+    return ('<?xml version="1.0"?>\n'
+        '<tree%s>\n'
+        '%s'
+        '</tree>') % (attributes, ''.join(parts))
+
+
+_CHART_ARCH = ('<?xml version="1.0"?>\n'
+    '<graph type="{type}" legend="{legend}">\n'
+    '    <x>\n'
+    '        <field name="{group}"/>\n'
+    '    </x>\n'
+    '    <y>\n'
+    '        <field name="{value}"{attributes}/>\n'
+    '    </y>\n'
+    '</graph>')
+
+
+@lru_cache(maxsize=256)
+def chart_arch(chart_type, interpolation, legend, group, value):
+    attributes = ''
+    if interpolation:
+        attributes = ' interpolation="%s"' % interpolation
+    return _CHART_ARCH.format(type=chart_type, legend=legend and '1' or '0',
+        group=group, value=value, attributes=attributes)
+
+
 VIEW_STATES = {
     'readonly': Bool(Eval('system'))
     }
@@ -895,6 +1268,7 @@ VIEW_DEPENDS = ['system']
 class View(ModelSQL, ModelView):
     'Shine View'
     __name__ = 'shine.view'
+    _action_fields = frozenset(('name', 'sheet'))
     name = fields.Char('Name', required=True, states=VIEW_STATES,
         depends=VIEW_DEPENDS)
     sheet = fields.Many2One('shine.sheet', 'Sheet', required=True,
@@ -1004,26 +1378,50 @@ class View(ModelSQL, ModelView):
 
     @fields.depends('type', 'chart_type')
     def on_change_type(self):
-        if self.type == 'chart' and not self.chart_type:
-            self.chart_type = 'vbar'
+        if self.chart_type or self.type != 'chart':
+            return
+        self.chart_type = 'vbar'
 
     @fields.depends('chart_type', 'chart_interpolation')
     def on_change_chart_type(self):
-        if self.chart_type == 'line' and not self.chart_interpolation:
-            self.chart_interpolation = 'linear'
+        if self.chart_interpolation or self.chart_type != 'line':
+            return
+        self.chart_interpolation = 'linear'
 
-    def get_current_table(self, name):
-        return self.sheet.current_table.id if self.sheet.current_table else None
+    @classmethod
+    def get_current_table(cls, views, name):
+        Sheet = Pool().get('shine.sheet')
+        view = cls.__table__()
+        sheet = Sheet.__table__()
+        cursor = Transaction().connection.cursor()
+
+        res = dict.fromkeys([x.id for x in views])
+        for sub_views in grouped_slice(views):
+            cursor.execute(*view.join(sheet,
+                    condition=view.sheet == sheet.id
+                    ).select(view.id, sheet.current_table,
+                    where=reduce_ids(view.id, [x.id for x in sub_views])))
+            res.update(cursor.fetchall())
+        return res
 
     @classmethod
     @ModelView.button
     def table_update_formulas(cls, views):
-        ViewTableFormula = Pool().get('shine.view.table.formula')
-        to_save = []
-        for view in views:
-            for formula in view.sheet.formulas:
-                to_save.append(ViewTableFormula(view=view, formula=formula))
-        ViewTableFormula.save(to_save)
+        pool = Pool()
+        Formula = pool.get('shine.formula')
+        ViewTableFormula = pool.get('shine.view.table.formula')
+
+        formulas = defaultdict(list)
+        for formula in Formula.search([
+                    ('sheet', 'in', list({x.sheet.id for x in views})),
+                    ]):
+            formulas[formula.sheet.id].append(formula)
+        to_create = [{
+                'view': view.id,
+                'formula': formula.id,
+                } for view in views for formula in formulas[view.sheet.id]]
+        if to_create:
+            ViewTableFormula.create(to_create)
 
     @classmethod
     @ModelView.button_action('shine.act_open_view_form')
@@ -1047,9 +1445,10 @@ class View(ModelSQL, ModelView):
         actions_to_update = []
         table_views_to_update = []
         for views, values in zip(actions, actions):
-            if not values.get('action'):
+            if not values.get('action') and cls._action_fields & values.keys():
                 actions_to_update += views
-            if not values.get('current_table_view'):
+            # Deleting a table view also writes None into current_table_view
+            if 'current_table_view' not in values:
                 table_views_to_update += views
 
         cls.update_actions(actions_to_update)
@@ -1064,27 +1463,37 @@ class View(ModelSQL, ModelView):
     def update_actions(cls, views):
         ActWindow = Pool().get('ir.action.act_window')
 
+        encode = _PYSON_ENCODER.encode
+        to_create = []
         to_write = []
+        new_views = []
         for view in views:
-            action = view.action
-            if not action:
-                action = ActWindow()
-            action.name = '%s (%s)' % (view.name, view.sheet.name)
-            action.res_model = 'shine.data'
-            action.usage = 'dashboard'
-            action.context = PYSONEncoder().encode({
-                    'shine_view': view.id,
-                    'shine_sheet': view.sheet.id,
-                    'shine_table': view.current_table.id,
-                    #'shine_table_view': view.current_table_view.id,
-                    })
-            action.save()
-            if not view.action:
-                to_write.append([view])
-                to_write.append({
-                        'action': action.id,
-                        })
+            sheet = view.sheet
+            values = {
+                'name': '%s (%s)' % (view.name, sheet.name),
+                'res_model': 'shine.data',
+                'usage': 'dashboard',
+                'context': encode({
+                        'shine_view': view.id,
+                        'shine_sheet': sheet.id,
+                        'shine_table': sheet.current_table.id,
+                        #'shine_table_view': view.current_table_view.id,
+                        }),
+                }
+            if view.action:
+                to_write.extend(([view.action], values))
+            else:
+                new_views.append(view)
+                to_create.append(values)
         if to_write:
+            ActWindow.write(*to_write)
+        if to_create:
+            actions = ActWindow.create(to_create)
+            to_write = []
+            for view, action in zip(new_views, actions):
+                to_write.extend(([view], {
+                            'action': action.id,
+                            }))
             with Transaction().set_context({
                         'shine_prevent_view_updates': True,
                         }):
@@ -1102,14 +1511,13 @@ class View(ModelSQL, ModelView):
     def update_table_views(cls, views):
         TableView = Pool().get('shine.table.view')
 
-        to_delete = []
+        to_delete = [x.current_table_view for x in views
+            if x.current_table_view]
+        if to_delete:
+            TableView.delete(to_delete)
+
         to_save = []
-        to_write = []
         for view in views:
-            if view.current_table:
-                to_delete += TableView.search([
-                        ('table', '=', view.current_table),
-                        ])
             table_view = TableView()
             table_view.table = view.current_table
             table_view.system = view.system
@@ -1117,88 +1525,36 @@ class View(ModelSQL, ModelView):
             table_view.arch = view_info['arch']
             table_view.type = view_info['type']
             to_save.append(table_view)
-            to_write.append([view])
-            to_write.append({
-                    'current_table_view': table_view.id,
-                    })
+        if not to_save:
+            return
+        TableView.save(to_save)
 
-        if to_delete:
-            TableView.delete(to_delete)
-        if to_save:
-            TableView.save(to_save)
-        if to_write:
-            with Transaction().set_context({
-                        'shine_prevent_view_updates': True,
-                        }):
-                cls.write(*to_write)
+        to_write = []
+        for view, table_view in zip(views, to_save):
+            to_write.extend(([view], {
+                        'current_table_view': table_view.id,
+                        }))
+        with Transaction().set_context({
+                    'shine_prevent_view_updates': True,
+                    }):
+            cls.write(*to_write)
 
     def get_view_info_table(self):
-        # TODO: Duplicated from get_tree_view() but this one is not editable
-        fields = []
-        current_icon = None
-        for line in self.table_formulas:
-            formula = line.formula
-            if formula.type in ('datetime', 'timestamp'):
-                fields.append('<field name="%s" widget="date"/>\n' %
-                    formula.alias)
-                fields.append('<field name="%s" widget="time"/>\n' %
-                    formula.alias)
-                continue
-            if formula.type == 'icon':
-                current_icon = formula.alias
-                continue
-            attributes = []
-            if formula.type in ('integer', 'float', 'numeric'):
-                attributes.append('sum="Total %s"' % formula.name)
-            if current_icon:
-                attributes.append('icon="%s"' % current_icon)
-                current_icon = None
-            if formula.type == 'image':
-                attributes.append('widget="image"')
-
-            fields.append('<field name="%s" %s/>\n' % (formula.alias,
-                    ' '.join(attributes)))
-
-        attributes = ''
-        if self.table_editable and self.table_editable != 'disabled':
-            attributes = 'editable="%s"' % self.table_editable
-        xml = ('<?xml version="1.0"?>\n'
-            '<tree %s>\n'
-            '%s'
-            '</tree>') % (attributes, '\n'.join(fields))
+        lines = tuple((x.formula.alias, x.formula.type, x.formula.name)
+            for x in self.table_formulas)
         return {
             'type': 'tree',
-            'fields': fields,
-            'arch': xml,
+            'fields': [x[0] for x in lines],
+            'arch': table_arch(lines, self.table_editable),
             }
 
     def get_view_info_chart(self):
-        x = '<field name="%s"/>\n' % self.chart_group.alias
-
-        attributes = ''
-        if self.chart_interpolation:
-            attributes = 'interpolation="%s"' % self.chart_interpolation
-        y = '<field name="%s" %s/>\n' % (self.chart_value.alias, attributes)
-
-        xml = ('<?xml version="1.0"?>\n'
-            '<graph type="%(type)s" legend="%(legend)s" %(attributes)s>\n'
-            '    <x>'
-            '        %(x)s'
-            '    </x>'
-            '    <y>'
-            '        %(y)s'
-            '    </y>'
-            '</graph>') % {
-                'type': self.chart_type,
-                'attributes': self.chart_interpolation,
-                'legend': self.chart_legend and '1' or '0',
-                'x': x,
-                'y': y,
-                }
         return {
             'type': 'graph',
             'fields': [self.chart_group.alias, self.chart_value.alias],
-            'arch': xml,
+            'arch': chart_arch(self.chart_type, self.chart_interpolation,
+                self.chart_legend, self.chart_group.alias,
+                self.chart_value.alias),
             }
 
     def get_view_info_dynamic_table(self):
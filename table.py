@@ -1,5 +1,4 @@
 import sql
-import formulas
 from datetime import datetime
 from dateutil import relativedelta
 from trytond import model
@@ -8,10 +7,19 @@ from trytond.transaction import Transaction
 from trytond.pool import Pool
 from trytond.i18n import gettext
 from trytond.exceptions import UserWarning
-from .shine import FIELD_TYPE_SQL, FIELD_TYPE_TRYTON, FIELD_TYPE_SELECTION
+from .shine import (FIELD_TYPE_SQL, FIELD_TYPE_TRYTON, FIELD_TYPE_SELECTION,
+    compile_expression, expression_ast)
 
 __all__ = ['Table', 'TableField', 'TableView']
 
+# Columns added to every table besides the ones of its fields
+_META_COLUMNS = (
+    ('create_uid', model.fields.Integer._sql_type),
+    ('write_uid', model.fields.Integer._sql_type),
+    ('create_date', model.fields.Timestamp._sql_type),
+    ('write_date', model.fields.Timestamp._sql_type),
+    )
+
 
 class ModelEmulation:
     __doc__ = None
@@ -38,45 +46,67 @@ class Table(model.ModelSQL, model.ModelView):
 
         table = backend.TableHandler(model, 'shine')
 
-        for name, field in (('create_uid', fields.Integer),
-                ('write_uid', fields.Integer),
-                ('create_date', fields.Timestamp),
-                ('write_date', fields.Timestamp)):
-            sql_type = field._sql_type
-            table.add_column(name, sql_type)
-
+        # The id column is already created by TableHandler
+        columns = {}
+        for name, sql_type in _META_COLUMNS:
+            columns[name] = sql_type
         for field in self.fields:
-            sql_type = FIELD_TYPE_SQL[field.type]
-            table.add_column(field.name, sql_type)
+            columns.setdefault(field.name, FIELD_TYPE_SQL[field.type])
+        columns = [(x, y) for x, y in columns.items()
+            if not table.column_exist(x)]
+
+        if backend.name == 'sqlite':
+            # SQLite only accepts one column per ALTER TABLE
+            add_column = table.add_column
+            for name, sql_type in columns:
+                add_column(name, sql_type)
+            return table
+
+        if columns:
+            sql_type = Transaction().database.sql_type
+            cursor = Transaction().connection.cursor()
+            cursor.execute('ALTER TABLE "%s" %s' % (self.name, ', '.join(
+                        'ADD COLUMN "%s" %s' % (x, sql_type(y)[1])
+                        for x, y in columns)))
+            table._update_definitions(columns=True)
         return table
 
     def drop_table(self):
-        transaction = Transaction()
-        backend.TableHandler.drop_table('', self.name, cascade=True)
-        transaction.database.sequence_delete(transaction.connection,
-            self.name + '_id_seq')
+        self.drop_tables([self])
+
+    @classmethod
+    def drop_tables(cls, tables):
+        names = [x.name for x in tables]
+        if not names:
+            return
+        cursor = Transaction().connection.cursor()
+        if backend.name == 'sqlite':
+            # SQLite has neither CASCADE nor sequences
+            for name in names:
+                cursor.execute('DROP TABLE IF EXISTS "%s"' % name)
+            return
+        cursor.execute('DROP TABLE IF EXISTS %s CASCADE'
+            % ', '.join('"%s"' % x for x in names))
+        cursor.execute('DROP SEQUENCE IF EXISTS %s'
+            % ', '.join('"%s_id_seq"' % x for x in names))
 
     def copy_from(self, from_table):
         Warning = Pool().get('res.user.warning')
 
-        fields = {x.name for x in self.fields}
-        from_fields = {x.name for x in from_table.fields}
-        missing = sorted(list(from_fields - fields))
-
-        existing = fields & from_fields
-        fields = {}
-        for field in self.fields:
-            if field.name in existing:
-                fields[field.name] = field.type
+        self_types = {x.name: x.type for x in self.fields}
+        from_types = {x.name: x.type for x in from_table.fields}
+        missing = sorted(from_types.keys() - self_types.keys())
 
+        existing = set()
         different_types = []
-        for field in from_table.fields:
-            if field.name in existing:
-                if (FIELD_TYPE_TRYTON[field.type] !=
-                        FIELD_TYPE_TRYTON[fields[field.name]]):
-                    different_types.append("%s (%s -> %s)" % (field.name,
-                            field.type, fields[field.name]))
-                    existing.remove(field.name)
+        for name, type_ in from_types.items():
+            if name not in self_types:
+                continue
+            if FIELD_TYPE_TRYTON[type_] != FIELD_TYPE_TRYTON[self_types[name]]:
+                different_types.append("%s (%s -> %s)" % (name, type_,
+                        self_types[name]))
+            else:
+                existing.add(name)
 
         if missing or different_types:
             message = ['- %s' % x for x in (missing + different_types)]
@@ -89,7 +119,7 @@ class Table(model.ModelSQL, model.ModelView):
         if not existing:
             return
 
-        existing = sorted(list(existing))
+        existing = sorted(existing)
         table = sql.Table(from_table.name)
         subquery = table.select()
         subquery.columns = [sql.Column(table, x) for x in existing]
@@ -100,28 +130,32 @@ class Table(model.ModelSQL, model.ModelView):
         cursor.execute(*query)
 
     def count(self):
-        table = sql.Table(self.name)
         cursor = Transaction().connection.cursor()
-        query = table.select(sql.aggregate.Count(1))
-        cursor.execute(*query)
+        cursor.execute('SELECT COUNT(*) FROM "%s"' % self.name)
         return cursor.fetchone()[0]
 
+    def is_empty(self):
+        cursor = Transaction().connection.cursor()
+        cursor.execute('SELECT 1 FROM "%s" LIMIT 1' % self.name)
+        return cursor.fetchone() is None
+
     @classmethod
     def remove_old_tables(cls, days=0):
         Sheet = Pool().get('shine.sheet')
-        current_table_ids = [x.current_table.id for x in Sheet.search([
-                    ('current_table', '!=', None)])]
-        tables = cls.search([
-                ('create_date', '<', datetime.now() -
-                    relativedelta.relativedelta(days=days)),
-                ('id', 'not in', current_table_ids),
-                ])
-        cls.delete(tables)
+        table = cls.__table__()
+        sheet = Sheet.__table__()
+        cursor = Transaction().connection.cursor()
+
+        cursor.execute(*table.select(table.id,
+                where=(table.create_date < datetime.now()
+                    - relativedelta.relativedelta(days=days))
+                & ~sql.operators.Exists(sheet.select(sheet.id,
+                        where=sheet.current_table == table.id))))
+        cls.delete(cls.browse([x for x, in cursor.fetchall()]))
 
     @classmethod
     def delete(cls, tables):
-        for table in tables:
-            table.drop_table()
+        cls.drop_tables(tables)
         super(Table, cls).delete(tables)
 
 
@@ -145,14 +179,10 @@ class TableField(ModelSQL, ModelView):
     def get_inputs(self, name):
         if not self.formula:
             return
-        parser = formulas.Parser()
-        ast = parser.ast(self.formula)[1].compile()
-        return (' '.join([x for x in ast.inputs])).lower()
+        return ' '.join(compile_expression(self.formula).inputs)
 
     def get_ast(self):
-        parser = formulas.Parser()
-        ast = parser.ast(self.formula)[1].compile()
-        return ast
+        return expression_ast(self.formula)
 
 
 class TableView(ModelSQL, ModelView):
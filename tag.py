@@ -1,6 +1,7 @@
 from trytond.model import ModelSQL, ModelView, fields, tree
 from trytond.pyson import Eval
 from trytond.pool import Pool
+from trytond.cache import Cache
 from trytond.i18n import gettext
 from trytond.exceptions import UserError
 
@@ -18,41 +19,18 @@ class TaggedMixin(object):
     def check_tags(cls, sheets):
         Tag = Pool().get('shine.tag')
 
-        required_tags = Tag.search([
-                ('required', '=', True),
-                ('view', '=', True),
-                ])
-        required_children = {}
-        for required in required_tags:
-            children = Tag.search([
-                    ('parent', 'child_of', [required.id]),
-                    ('id', '!=', required.id),
-                    ])
-            required_children[required] = {x.id for x in children}
-
-        unique_tags = Tag.search([
-                ('unique', '=', True),
-                ('view', '=', True),
-                ])
-        unique_children = {}
-        for unique in unique_tags:
-            children = Tag.search([
-                    ('parent', 'child_of', [unique.id]),
-                    ('id', '!=', unique.id),
-                    ])
-            unique_children[unique] = {x.id for x in children}
-
+        required_children, unique_children = Tag.get_view_children()
         for sheet in sheets:
             sheet_tag_ids = {x.id for x in sheet.tags}
-            for view, children in required_children.items():
+            for view, children in required_children:
                 if not (sheet_tag_ids & children):
                     raise UserError(gettext('shine.missing_tags',
-                        record=sheet.rec_name, tag=view.rec_name))
+                        record=sheet.rec_name, tag=Tag(view).rec_name))
 
-            for view, children in unique_children.items():
+            for view, children in unique_children:
                 if len(sheet_tag_ids & children) > 1:
                     raise UserError(gettext('shine.repeated_tags',
-                        record=sheet.rec_name, tag=view.rec_name))
+                        record=sheet.rec_name, tag=Tag(view).rec_name))
 
 
 class Tag(tree(separator=' / '), ModelSQL, ModelView):
@@ -72,11 +50,61 @@ class Tag(tree(separator=' / '), ModelSQL, ModelView):
             }, depends=['view'], help='At least one of the children tags of '
         'the current tag must be used in all Sheets or Dashboards')
 
+    _view_children_cache = Cache('shine.tag.view_children', context=False)
+
     @classmethod
     def __setup__(cls):
         super(Tag, cls).__setup__()
         cls._order.insert(0, ('name', 'ASC'))
 
+    @classmethod
+    def create(cls, vlist):
+        cls._view_children_cache.clear()
+        return super(Tag, cls).create(vlist)
+
+    @classmethod
+    def write(cls, *args):
+        cls._view_children_cache.clear()
+        super(Tag, cls).write(*args)
+
+    @classmethod
+    def delete(cls, tags):
+        cls._view_children_cache.clear()
+        super(Tag, cls).delete(tags)
+
+    @classmethod
+    def get_view_children(cls):
+        res = cls._view_children_cache.get(None)
+        if res is not None:
+            return res
+
+        roots = cls.search([
+                ('view', '=', True),
+                ['OR',
+                    ('required', '=', True),
+                    ('unique', '=', True),
+                    ],
+                ])
+        children = {x.id: set() for x in roots}
+        if roots:
+            parents = {x['id']: x['parent'] for x in cls.search_read([
+                        ('parent', 'child_of', list(children)),
+                        ], fields_names=['parent'])}
+            for tag_id in parents:
+                parent = parents[tag_id]
+                while parent is not None:
+                    if parent in children:
+                        children[parent].add(tag_id)
+                    parent = parents.get(parent)
+        res = (
+            tuple((x.id, frozenset(children[x.id])) for x in roots
+                if x.required),
+            tuple((x.id, frozenset(children[x.id])) for x in roots
+                if x.unique),
+            )
+        cls._view_children_cache.set(None, res)
+        return res
+
 
 class SheetTag(ModelSQL):
     'Shine Sheet - Tag'
@@ -2,7 +2,13 @@
 # This file is part of Tryton.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
 
-from trytond.tests.test_tryton import ModuleTestCase
+from decimal import Decimal
+
+from trytond import backend
+from trytond.exceptions import UserError
+from trytond.tests.test_tryton import ModuleTestCase, with_transaction
+from trytond.pool import Pool
+from trytond.transaction import Transaction
 
 
 class ShineTestCase(ModuleTestCase):
@@ -10,5 +16,249 @@ class ShineTestCase(ModuleTestCase):
     module = 'shine'
     extras = ['dashboard']
 
+    def create_sheet(self, dataset, formulas):
+        pool = Pool()
+        Sheet = pool.get('shine.sheet')
+        Formula = pool.get('shine.formula')
+
+        sheet = Sheet(name='Sheet', alias='sheet', dataset=dataset,
+            timeout=30)
+        sheet.save()
+        for sequence, (alias, type_, expression) in enumerate(formulas):
+            formula = Formula(sheet=sheet, name=alias, alias=alias,
+                type=type_, expression=expression, store=True,
+                sequence=sequence)
+            formula.save()
+        sheet = Sheet(sheet.id)
+        Sheet.activate([sheet])
+        sheet = Sheet(sheet.id)
+        Sheet.compute([sheet])
+        return sheet
+
+    def read_sheet(self, sheet, aliases):
+        cursor = Transaction().connection.cursor()
+        cursor.execute('SELECT %s FROM "%s" ORDER BY 1' % (
+                ', '.join('"%s"' % x for x in aliases),
+                sheet.data_table_name))
+        return cursor.fetchall()
+
+    @with_transaction()
+    def test_compute_sql(self):
+        'Test compute sheet with SQL data set'
+        pool = Pool()
+        DataSet = pool.get('shine.dataset')
+        User = pool.get('res.user')
+
+        User.create([{'name': 'Test', 'login': 'test'}])
+        dataset = DataSet(name='SQL', source='sql',
+            query='SELECT id AS a, login AS l FROM res_user')
+        dataset.save()
+        sheet = self.create_sheet(dataset, [
+                ('a', 'integer', None),
+                ('l', 'char', None),
+                ('r', 'integer', '=a'),
+                ('b', 'integer', '=a+1'),
+                ('c', 'integer', '=b*2'),
+                ('m', 'char', '=l'),
+                ('n', 'integer', '=LEN(l)'),
+                ('t', 'char', 'text'),
+                ('x', 'float', '=RAND()'),
+                ])
+
+        users = sorted((x.id, x.login) for x in User.search([
+                    ('active', 'in', [True, False]),
+                    ]))
+        self.assertGreater(len(users), 1)
+        self.assertEqual(self.read_sheet(sheet,
+                ['a', 'l', 'r', 'b', 'c', 'm', 'n', 't']), [
+                (a, l, a, a + 1, (a + 1) * 2, l, len(l), 'text')
+                for a, l in users])
+        random = [x for x, in self.read_sheet(sheet, ['x'])]
+        self.assertEqual(len(set(random)), len(users))
+        self.assertTrue(all(0 <= x < 1 for x in random))
+
+        # Computing again replaces the rows
+        pool.get('shine.sheet').compute([sheet])
+        self.assertEqual(len(self.read_sheet(sheet, ['a'])), len(users))
+
+    @with_transaction()
+    def test_compute_model(self):
+        'Test compute sheet with model data set'
+        pool = Pool()
+        DataSet = pool.get('shine.dataset')
+        Model = pool.get('ir.model')
+        User = pool.get('res.user')
+
+        model, = Model.search([('model', '=', 'res.user')])
+        dataset = DataSet(name='Model', source='model', model=model)
+        dataset.save()
+        sheet = self.create_sheet(dataset, [
+                ('login', 'char', None),
+                ])
+
+        self.assertEqual(self.read_sheet(sheet, ['login']),
+            sorted((x.login,) for x in User.search([])))
+
+    @with_transaction()
+    def test_compute_sheet_dataset(self):
+        'Test compute sheet with sheet data set and no formulas'
+        pool = Pool()
+        DataSet = pool.get('shine.dataset')
+
+        dataset = DataSet(name='SQL', source='sql',
+            query='SELECT id AS a FROM res_user')
+        dataset.save()
+        source = self.create_sheet(dataset, [
+                ('a', 'integer', None),
+                ('b', 'integer', '=a*3'),
+                ])
+        dataset = DataSet(name='Sheet', source='sheet', sheet=source)
+        dataset.save()
+        sheet = self.create_sheet(dataset, [
+                ('a', 'integer', None),
+                ('b', 'integer', None),
+                ])
+
+        self.assertEqual(self.read_sheet(sheet, ['a', 'b']),
+            self.read_sheet(source, ['a', 'b']))
+
+    @with_transaction()
+    def test_drop_tables(self):
+        'Test drop tables'
+        pool = Pool()
+        DataSet = pool.get('shine.dataset')
+        Table = pool.get('shine.table')
+
+        dataset = DataSet(name='SQL', source='sql',
+            query='SELECT id AS a FROM res_user')
+        dataset.save()
+        tables = [self.create_sheet(dataset, [
+                    ('a', 'integer', None),
+                    ]).current_table for _ in range(2)]
+        names = [x.name for x in tables]
+        for name in names:
+            self.assertTrue(backend.TableHandler.table_exist(name))
+
+        Table.drop_tables(tables)
+        for name in names:
+            self.assertFalse(backend.TableHandler.table_exist(name))
+
+    @with_transaction()
+    def test_check_tags(self):
+        'Test required and unique tags of sheets'
+        pool = Pool()
+        Sheet = pool.get('shine.sheet')
+        Tag = pool.get('shine.tag')
+
+        required = Tag(name='Required', view=True, required=True)
+        required.save()
+        unique = Tag(name='Unique', view=True, unique=True, parent=required)
+        unique.save()
+        child1 = Tag(name='Child 1', parent=unique)
+        child1.save()
+        child2 = Tag(name='Child 2', parent=unique)
+        child2.save()
+        grandchild = Tag(name='Grandchild', parent=child1)
+        grandchild.save()
+
+        for tags in [[child1], [grandchild]]:
+            Sheet(name='Sheet', alias='sheet', timeout=30, tags=tags).save()
+        for tags in [[], [child1, child2], [child1, grandchild]]:
+            sheet = Sheet(name='Sheet', alias='sheet', timeout=30, tags=tags)
+            with self.assertRaises(UserError):
+                sheet.save()
+
+    @with_transaction()
+    def test_view_children(self):
+        'Test view children of tags'
+        pool = Pool()
+        Tag = pool.get('shine.tag')
+
+        required = Tag(name='Required', view=True, required=True)
+        required.save()
+        unique = Tag(name='Unique', view=True, unique=True, parent=required)
+        unique.save()
+        child1 = Tag(name='Child 1', parent=unique)
+        child1.save()
+        child2 = Tag(name='Child 2', parent=child1)
+        child2.save()
+        other = Tag(name='Other', view=True)
+        other.save()
+        Tag(name='Other Child', parent=other).save()
+
+        self.assertEqual(Tag.get_view_children(), (
+                ((required.id,
+                        frozenset([unique.id, child1.id, child2.id])),),
+                ((unique.id, frozenset([child1.id, child2.id])),),
+                ))
+
+        child2.parent = None
+        child2.save()
+        self.assertEqual(Tag.get_view_children(), (
+                ((required.id, frozenset([unique.id, child1.id])),),
+                ((unique.id, frozenset([child1.id])),),
+                ))
+
+    def test_row_evaluator(self):
+        'Test memoized formulas tell equal values apart'
+        from ..shine import expression_ast, row_evaluator
+
+        evaluate = row_evaluator(expression_ast('=LEN(a)'), int, False)
+        self.assertEqual([evaluate(x) for x in [Decimal('1.0'),
+                        Decimal('1.00'), Decimal('1'), 'ab', 'ab', True, 1]],
+            [3, 4, 1, 2, 2, 4, 1])
+
+    @with_transaction()
+    def test_table_count(self):
+        'Test count table rows'
+        pool = Pool()
+        DataSet = pool.get('shine.dataset')
+        User = pool.get('res.user')
+
+        dataset = DataSet(name='SQL', source='sql',
+            query='SELECT id AS a FROM res_user')
+        dataset.save()
+        table = self.create_sheet(dataset, [
+                ('a', 'integer', None),
+                ]).current_table
+
+        self.assertEqual(table.count(), User.search([
+                    ('active', 'in', [True, False]),
+                    ], count=True))
+        self.assertFalse(table.is_empty())
+
+    @with_transaction()
+    def test_compute_cast(self):
+        'Test compute sheet with columns of other types than the data set'
+        pool = Pool()
+        DataSet = pool.get('shine.dataset')
+
+        dataset = DataSet(name='SQL', source='sql',
+            query="SELECT '5' AS a, 2 AS b")
+        dataset.save()
+        sheet = self.create_sheet(dataset, [
+                ('a', 'integer', None),
+                ('b', 'char', None),
+                ])
+
+        self.assertEqual(self.read_sheet(sheet, ['a', 'b']), [(5, '2')])
+
+    @with_transaction()
+    def test_formula_error(self):
+        'Test formula error lists each missing alias once'
+        pool = Pool()
+        Sheet = pool.get('shine.sheet')
+        Formula = pool.get('shine.formula')
+
+        sheet = Sheet(name='Sheet', alias='sheet', timeout=30)
+        sheet.save()
+        formula = Formula(sheet=sheet, name='Total', alias='total',
+            type='integer', expression='=a+b+a*2', store=True)
+        formula.save()
+
+        self.assertEqual(formula.formula_error(), ('warning',
+                'Referenced alias "a, b" not found. Ensure it is declared '
+                'before this formula.'))
+
 
 del ModuleTestCase